@@ -1,15 +1,50 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, BackgroundTasks, File, Request, UploadFile, HTTPException, Form
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
+import aiofiles
+import asyncio
+import json
 import os
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import uuid
 
-from legal_ai_system import legal_ai_system
+from config import settings
+from legal_ai_system import get_system
 from models import LegalResponse
 
+# Chunk size for streaming uploads to disk (1 MB)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Status of queued upload-processing tasks, keyed by file_id
+# (in-memory; use a shared store such as Redis when running multiple workers)
+_task_status: Dict[str, Dict[str, Any]] = {}
+
+def _process_upload_task(file_path: str, file_id: str, filename: str):
+    """Process a queued upload and record its outcome"""
+    _task_status[file_id] = {"status": "processing", "filename": filename}
+    try:
+        result = get_system().process_uploaded_pdf(file_path)
+        if result["success"]:
+            _task_status[file_id] = {
+                "status": "completed",
+                "filename": filename,
+                "result": result
+            }
+        else:
+            os.remove(file_path)
+            _task_status[file_id] = {
+                "status": "failed",
+                "filename": filename,
+                "error": result["error"]
+            }
+    except Exception as e:
+        _task_status[file_id] = {
+            "status": "failed",
+            "filename": filename,
+            "error": str(e)
+        }
+
 app = FastAPI(
     title="Legal AI Assistant",
     description="AI-powered legal document processing and response generation system",
@@ -25,6 +60,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def configure_threadpool():
+    """Raise the default threadpool size so blocking LLM/embedding calls
+    don't serialize concurrent requests"""
+    from anyio import to_thread
+    to_thread.current_default_thread_limiter().total_tokens = 64
+
 @app.get("/")
 async def root():
     """Root endpoint with system information"""
@@ -38,7 +80,7 @@ async def root():
 async def health_check():
     """Health check endpoint"""
     try:
-        stats = legal_ai_system.get_system_stats()
+        stats = get_system().get_system_stats()
         return {
             "status": "healthy",
             "system_stats": stats
@@ -46,46 +88,70 @@ async def health_check():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"System error: {str(e)}")
 
-@app.post("/upload-pdf")
+@app.post("/upload-pdf", status_code=202)
 async def upload_and_process_pdf(
+    request: Request,
+    tasks: BackgroundTasks,
     file: UploadFile = File(...),
     response_type: str = Form("professional")
 ):
-    """Upload and process a PDF document"""
+    """Upload a PDF document and queue it for processing"""
     try:
         # Validate file type
         if not file.filename.lower().endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
-        
+
+        # Reject oversized uploads before touching disk
+        content_length = request.headers.get("content-length")
+        if content_length and int(content_length) > settings.max_upload_bytes:
+            raise HTTPException(status_code=413, detail="Uploaded file is too large")
+
         # Create unique filename
         file_id = str(uuid.uuid4())
         filename = f"{file_id}_{file.filename}"
-        file_path = legal_ai_system.uploads_dir / filename
-        
-        # Save uploaded file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Process the PDF
-        result = legal_ai_system.process_uploaded_pdf(str(file_path))
-        
-        if not result["success"]:
-            # Clean up file on error
-            os.remove(file_path)
-            raise HTTPException(status_code=400, detail=result["error"])
-        
+        file_path = get_system().uploads_dir / filename
+
+        # Stream uploaded file to disk in bounded chunks, enforcing the size
+        # cap on the actual bytes received (Content-Length can lie or be absent)
+        bytes_written = 0
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                bytes_written += len(chunk)
+                if bytes_written > settings.max_upload_bytes:
+                    os.remove(file_path)
+                    raise HTTPException(status_code=413, detail="Uploaded file is too large")
+                await buffer.write(chunk)
+
+        # Queue processing so the connection isn't held for the full pipeline
+        _task_status[file_id] = {"status": "queued", "filename": file.filename}
+        tasks.add_task(_process_upload_task, str(file_path), file_id, file.filename)
+
         return {
             "success": True,
             "file_id": file_id,
             "filename": file.filename,
-            "result": result
+            "status": "queued"
         }
-        
+
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Processing error: {str(e)}")
 
+@app.get("/status/{file_id}")
+async def get_task_status(file_id: str):
+    """Get the processing status of an uploaded PDF"""
+    status = _task_status.get(file_id)
+
+    if status is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    return {
+        "success": True,
+        "file_id": file_id,
+        **status
+    }
+
 @app.post("/process-pdf")
 async def process_existing_pdf(
     file_path: str = Form(...),
@@ -96,8 +162,8 @@ async def process_existing_pdf(
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found")
         
-        result = legal_ai_system.process_uploaded_pdf(file_path)
-        
+        result = await asyncio.to_thread(get_system().process_uploaded_pdf, file_path)
+
         if not result["success"]:
             raise HTTPException(status_code=400, detail=result["error"])
         
@@ -115,7 +181,9 @@ async def generate_response(
 ):
     """Generate a legal response for a specific document"""
     try:
-        response = legal_ai_system.generate_response_for_document(document_id, response_type)
+        response = await asyncio.to_thread(
+            get_system().generate_response_for_document, document_id, response_type
+        )
         
         if response is None:
             raise HTTPException(status_code=404, detail="Document not found")
@@ -146,14 +214,17 @@ async def search_documents(
 ):
     """Search for similar documents"""
     try:
-        results = legal_ai_system.search_similar_documents(query, n_results)
-        
-        return {
-            "success": True,
-            "query": query,
-            "results": results
-        }
-        
+        results = await asyncio.to_thread(get_system().search_similar_documents, query, n_results)
+
+        # Stream results one document at a time instead of building one JSON blob
+        async def stream_results():
+            yield '{"success": true, "query": ' + json.dumps(query) + ', "results": ['
+            for i, result in enumerate(results):
+                yield (", " if i else "") + json.dumps(result)
+            yield "]}"
+
+        return StreamingResponse(stream_results(), media_type="application/json")
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
 
@@ -161,7 +232,7 @@ async def search_documents(
 async def get_document_info(document_id: str):
     """Get information about a specific document"""
     try:
-        chunks = legal_ai_system.vector_store.get_document_chunks(document_id)
+        chunks = get_system().vector_store.get_document_chunks(document_id)
         
         if not chunks:
             raise HTTPException(status_code=404, detail="Document not found")
@@ -186,11 +257,39 @@ async def get_document_info(document_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Document retrieval error: {str(e)}")
 
+@app.get("/document/{document_id}/pdf")
+async def download_document_pdf(document_id: str):
+    """Download the original PDF for a document"""
+    try:
+        chunks = get_system().vector_store.get_document_chunks(document_id)
+
+        if not chunks:
+            raise HTTPException(status_code=404, detail="Document not found")
+
+        metadata = chunks[0].metadata
+        source_file = metadata.get("source_file")
+
+        if not source_file or not os.path.exists(source_file):
+            raise HTTPException(status_code=404, detail="Original PDF file not available")
+
+        # FileResponse serves from disk (sendfile where available) without
+        # loading the PDF back into memory
+        return FileResponse(
+            source_file,
+            media_type="application/pdf",
+            filename=metadata.get("filename", "document.pdf")
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Document retrieval error: {str(e)}")
+
 @app.delete("/document/{document_id}")
 async def delete_document(document_id: str):
     """Delete a document from the system"""
     try:
-        success = legal_ai_system.vector_store.delete_document(document_id)
+        success = get_system().delete_document(document_id)
         
         if not success:
             raise HTTPException(status_code=404, detail="Document not found")
@@ -209,7 +308,7 @@ async def delete_document(document_id: str):
 async def get_system_stats():
     """Get system statistics"""
     try:
-        stats = legal_ai_system.get_system_stats()
+        stats = get_system().get_system_stats()
         return {
             "success": True,
             "stats": stats
@@ -222,18 +321,42 @@ async def get_system_stats():
 async def batch_process_pdfs(file_paths: List[str]):
     """Process multiple PDF files in batch"""
     try:
-        results = legal_ai_system.batch_process_pdfs(file_paths)
-        
+        results = await get_system().abatch_process_pdfs(file_paths)
+
         return {
             "success": True,
             "results": results,
             "total_files": len(file_paths),
             "successful": len([r for r in results if r["success"]])
         }
-        
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Batch processing error: {str(e)}")
 
+@app.get("/batch-responses/{batch_id}")
+async def get_batch_responses(batch_id: str):
+    """Collect responses queued via the OpenAI Batch API during batch
+    processing (see the response_batch_id field in /batch-process results)"""
+    try:
+        responses = await asyncio.to_thread(get_system().collect_batch_responses, batch_id)
+
+        return {
+            "success": True,
+            "batch_id": batch_id,
+            "completed": bool(responses),
+            "responses": responses
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch collection error: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
+    # WEB_CONCURRENCY > 1 runs one process per worker; in-memory state
+    # (task status, caches) is then per-worker unless backed by Redis
+    uvicorn.run(
+        "api:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
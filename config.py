@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
+from functools import lru_cache
 from typing import Optional
-import os
 
 class Settings(BaseSettings):
     openai_api_key: str
@@ -8,13 +8,37 @@ class Settings(BaseSettings):
     model_name: str = "gpt-4"
     temperature: float = 0.1
     max_tokens: int = 2000
+    embedding_model: str = "all-MiniLM-L6-v2"
+    embedding_backend: str = "torch"  # "torch" or "onnx"
+    embedding_quantization: str = "none"  # "none", "fp16" or "int8"
+    semantic_cache_threshold: float = 0.97
+    max_upload_bytes: int = 50 * 1024 * 1024
+    max_concurrency: int = 4
+    use_batch_api: bool = False
+    llm_cache_path: str = "./llm_cache.db"
     
     class Config:
         env_file = ".env"
         case_sensitive = False
 
-# Global settings instance
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Build the settings object once, on first use"""
+    return Settings()
+
+@lru_cache(maxsize=1)
+def get_http_client():
+    """Shared httpx client so every LLM client reuses one connection pool.
 
-# Ensure ChromaDB directory exists
-os.makedirs(settings.chroma_db_path, exist_ok=True) 
+    Without this each ChatOpenAI instance opens its own pool and pays the
+    TCP/TLS handshake again; with keep-alive connections the handshake
+    happens once per host.
+    """
+    import httpx
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=httpx.Timeout(60.0)
+    )
+
+# Global settings instance
+settings = get_settings()
@@ -1,125 +1,257 @@
+import logging
 import pypdf
+try:
+    import fitz  # PyMuPDF, C-backed and much faster than pypdf
+except ImportError:
+    fitz = None
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
+import hashlib
+import io
+import json
+import os
 import uuid
 import re
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import HumanMessage, SystemMessage
 
-from config import settings
+from config import settings, get_http_client
 from models import LegalDocument, DocumentChunk, DocumentType, ProcessingResult
 
+logger = logging.getLogger(__name__)
+
+# Maximum number of cached LLM results kept per cache
+LLM_CACHE_SIZE = 1024
+
+# Single-pass parser for models that drift back to the legacy PARTIES:/ISSUES: format
+_PI_RE = re.compile(r"PARTIES:\s*(.*?)\s*ISSUES:\s*(.*)", re.DOTALL)
+
+# Token-window chunking parameters; windows stay under MiniLM's 512-token limit
+CHUNK_TOKENS = 256
+CHUNK_OVERLAP_TOKENS = 50
+
+_token_encoding = tiktoken.get_encoding("cl100k_base") if tiktoken is not None else None
+
+@lru_cache(maxsize=1)
+def _get_llm() -> ChatOpenAI:
+    """Create the shared ChatOpenAI client once, on first use"""
+    return ChatOpenAI(
+        model=settings.model_name,
+        temperature=settings.temperature,
+        max_tokens=settings.max_tokens,
+        api_key=settings.openai_api_key,
+        http_client=get_http_client()
+    )
+
+# PDFs with more pages than this are extracted in parallel worker processes
+PARALLEL_EXTRACT_MIN_PAGES = 8
+
+_extract_executor: Optional[ProcessPoolExecutor] = None
+
+def _get_extract_executor() -> ProcessPoolExecutor:
+    global _extract_executor
+    if _extract_executor is None:
+        _extract_executor = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+    return _extract_executor
+
+def _extract_pages(pdf_path: str, start: int, end: int) -> str:
+    """Extract a page range; each worker reopens the file so no PDF objects are pickled"""
+    if fitz is not None:
+        with fitz.open(pdf_path) as doc:
+            return "\n".join(doc[i].get_text("text") for i in range(start, end))
+
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = pypdf.PdfReader(file)
+        return "\n".join(pdf_reader.pages[i].extract_text() or "" for i in range(start, end))
+
 class DocumentProcessor:
     """Process legal documents and extract structured information"""
     
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model=settings.model_name,
-            temperature=settings.temperature,
-            max_tokens=settings.max_tokens,
-            api_key=settings.openai_api_key
-        )
-        
+        self.llm = _get_llm()
+
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
             length_function=len,
             separators=["\n\n", "\n", ". ", " ", ""]
         )
-    
+
+        # Cache keyed by SHA-256 of the truncated content so re-processing
+        # identical documents skips the LLM round-trip
+        self._analysis_cache: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _content_key(content: str) -> str:
+        """Build a cache key from the content prefix sent to the LLM"""
+        return hashlib.sha256(content[:2000].encode("utf-8", "ignore")).hexdigest()
+
+    @staticmethod
+    def _cache_put(cache: Dict[str, Any], key: str, value: Any) -> None:
+        """Insert into a bounded cache, evicting the oldest entry when full"""
+        if len(cache) >= LLM_CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+        cache[key] = value
+
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extract text content from PDF file"""
         try:
+            page_count = self._page_count(pdf_path)
+            if page_count > PARALLEL_EXTRACT_MIN_PAGES:
+                text = self._extract_text_parallel(pdf_path, page_count)
+                if text is not None:
+                    return text
+
+            if fitz is not None:
+                with fitz.open(pdf_path) as doc:
+                    return "\n".join(page.get_text("text") for page in doc).strip()
+
+            # Fallback when PyMuPDF is unavailable
             with open(pdf_path, 'rb') as file:
                 pdf_reader = pypdf.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text.strip()
+                parts = [page.extract_text() or "" for page in pdf_reader.pages]
+                return "\n".join(parts).strip()
         except Exception as e:
             raise Exception(f"Error extracting text from PDF: {e}")
-    
-    def classify_document_type(self, content: str) -> DocumentType:
-        """Classify the type of legal document using LLM"""
+
+    def extract_text_from_bytes(self, data: bytes) -> str:
+        """Extract text content from in-memory PDF bytes, skipping disk I/O"""
         try:
-            classification_prompt = ChatPromptTemplate.from_messages([
-                ("system", """You are a legal document classifier. Analyze the content and classify it into one of these categories:
-                - legal_letter: General legal correspondence
-                - contract: Legal agreements, contracts, terms
-                - notice: Legal notices, warnings, formal announcements
-                - complaint: Legal complaints, grievances
-                - response: Legal responses, replies, counter-arguments
-                
-                Respond with only the category name."""),
-                ("human", "Classify this legal document:\n\n{content}")
-            ])
-            
-            response = self.llm.invoke(
-                classification_prompt.format_messages(content=content[:2000])
-            )
-            
-            doc_type_str = response.content.strip().lower()
-            
-            # Map response to enum
-            type_mapping = {
-                "legal_letter": DocumentType.LEGAL_LETTER,
-                "contract": DocumentType.CONTRACT,
-                "notice": DocumentType.NOTICE,
-                "complaint": DocumentType.COMPLAINT,
-                "response": DocumentType.RESPONSE
-            }
-            
-            return type_mapping.get(doc_type_str, DocumentType.LEGAL_LETTER)
-            
+            if fitz is not None:
+                with fitz.open(stream=data, filetype="pdf") as doc:
+                    return "\n".join(page.get_text("text") for page in doc).strip()
+
+            pdf_reader = pypdf.PdfReader(io.BytesIO(data))
+            parts = [page.extract_text() or "" for page in pdf_reader.pages]
+            return "\n".join(parts).strip()
         except Exception as e:
-            print(f"Error classifying document: {e}")
-            return DocumentType.LEGAL_LETTER
+            raise Exception(f"Error extracting text from PDF bytes: {e}")
+
+    @staticmethod
+    def _page_count(pdf_path: str) -> int:
+        """Count pages without extracting any text"""
+        if fitz is not None:
+            with fitz.open(pdf_path) as doc:
+                return len(doc)
+        with open(pdf_path, 'rb') as file:
+            return len(pypdf.PdfReader(file).pages)
+
+    def _extract_text_parallel(self, pdf_path: str, page_count: int) -> Optional[str]:
+        """Split page extraction across worker processes; None on failure"""
+        try:
+            executor = _get_extract_executor()
+            workers = min(4, os.cpu_count() or 1)
+            step = -(-page_count // workers)  # Ceiling division
+            ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+            futures = [executor.submit(_extract_pages, pdf_path, start, end) for start, end in ranges]
+            return "\n".join(future.result() for future in futures).strip()
+        except Exception as e:
+            logger.exception("Error extracting pages in parallel")
+            return None
     
-    def extract_parties_and_issues(self, content: str) -> tuple[List[str], List[str]]:
-        """Extract parties involved and key legal issues using LLM"""
+    # Map LLM labels to the DocumentType enum
+    _TYPE_MAPPING = {
+        "legal_letter": DocumentType.LEGAL_LETTER,
+        "contract": DocumentType.CONTRACT,
+        "notice": DocumentType.NOTICE,
+        "complaint": DocumentType.COMPLAINT,
+        "response": DocumentType.RESPONSE
+    }
+
+    def analyze_document(self, content: str) -> Dict[str, Any]:
+        """Classify the document and extract parties/issues in a single LLM call"""
+        cache_key = self._content_key(content)
+        if cache_key in self._analysis_cache:
+            return self._analysis_cache[cache_key]
+
+        analysis = {
+            "document_type": DocumentType.LEGAL_LETTER,
+            "parties": [],
+            "issues": []
+        }
+
         try:
-            extraction_prompt = ChatPromptTemplate.from_messages([
-                ("system", """You are a legal document analyzer. Extract:
-                1. Parties involved (names of people, companies, organizations)
-                2. Key legal issues mentioned
-                
-                Format your response as:
-                PARTIES: [comma-separated list]
-                ISSUES: [comma-separated list]"""),
+            analysis_prompt = ChatPromptTemplate.from_messages([
+                ("system", """You are a legal document analyzer. Analyze the content and respond with a JSON object containing:
+                - "document_type": one of legal_letter (general legal correspondence), contract (agreements, terms), notice (legal notices, warnings), complaint (complaints, grievances), response (replies, counter-arguments)
+                - "parties": list of parties involved (names of people, companies, organizations)
+                - "issues": list of key legal issues mentioned
+
+                Respond with only the JSON object."""),
                 ("human", "Analyze this legal document:\n\n{content}")
             ])
-            
+
             response = self.llm.invoke(
-                extraction_prompt.format_messages(content=content[:2000])
+                analysis_prompt.format_messages(content=content[:2000])
             )
-            
-            response_text = response.content
-            
-            # Parse response
-            parties = []
-            issues = []
-            
-            if "PARTIES:" in response_text:
-                parties_section = response_text.split("PARTIES:")[1].split("ISSUES:")[0]
-                parties = [p.strip() for p in parties_section.strip().split(",") if p.strip()]
-            
-            if "ISSUES:" in response_text:
-                issues_section = response_text.split("ISSUES:")[1]
-                issues = [i.strip() for i in issues_section.strip().split(",") if i.strip()]
-            
-            return parties, issues
-            
+
+            parsed = self._parse_json_response(response.content)
+
+            if parsed:
+                doc_type_str = str(parsed.get("document_type", "")).strip().lower()
+                analysis["document_type"] = self._TYPE_MAPPING.get(doc_type_str, DocumentType.LEGAL_LETTER)
+                analysis["parties"] = [str(p).strip() for p in parsed.get("parties", []) if str(p).strip()]
+                analysis["issues"] = [str(i).strip() for i in parsed.get("issues", []) if str(i).strip()]
+            else:
+                match = _PI_RE.search(response.content)
+                if match:
+                    analysis["parties"] = [p.strip() for p in match.group(1).split(",") if p.strip()]
+                    analysis["issues"] = [i.strip() for i in match.group(2).split(",") if i.strip()]
+
+            self._cache_put(self._analysis_cache, cache_key, analysis)
+
         except Exception as e:
-            print(f"Error extracting parties and issues: {e}")
-            return [], []
+            logger.exception("Error analyzing document")
+
+        return analysis
+
+    @staticmethod
+    def _parse_json_response(response_text: str) -> Dict[str, Any]:
+        """Parse a JSON object from an LLM response, tolerating code fences"""
+        text = response_text.strip()
+        start = text.find("{")
+        end = text.rfind("}")
+        if start == -1 or end == -1:
+            return {}
+        try:
+            return json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            return {}
+
+    def analysis_from_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a marshalled-analysis entry into analyze_document's shape"""
+        doc_type_str = str(entry.get("document_type", "")).strip().lower()
+        return {
+            "document_type": self._TYPE_MAPPING.get(doc_type_str, DocumentType.LEGAL_LETTER),
+            "parties": [str(p).strip() for p in entry.get("parties", []) if str(p).strip()],
+            "issues": [str(i).strip() for i in entry.get("key_issues", []) if str(i).strip()]
+        }
+
+    def classify_document_type(self, content: str) -> DocumentType:
+        """Classify the type of legal document using LLM"""
+        return self.analyze_document(content)["document_type"]
+
+    def extract_parties_and_issues(self, content: str) -> tuple[List[str], List[str]]:
+        """Extract parties involved and key legal issues using LLM"""
+        analysis = self.analyze_document(content)
+        return analysis["parties"], analysis["issues"]
     
     def create_chunks(self, content: str, document_id: str, metadata: Dict[str, Any]) -> List[DocumentChunk]:
         """Create chunks from document content"""
         try:
             # Split text into chunks
-            text_chunks = self.text_splitter.split_text(content)
-            
+            if _token_encoding is not None:
+                text_chunks = self._split_by_tokens(content)
+            else:
+                text_chunks = self.text_splitter.split_text(content)
+
             chunks = []
             for i, chunk_text in enumerate(text_chunks):
                 chunk = DocumentChunk(
@@ -134,29 +266,65 @@ class DocumentProcessor:
             return chunks
             
         except Exception as e:
-            print(f"Error creating chunks: {e}")
+            logger.exception("Error creating chunks")
             return []
+
+    @staticmethod
+    def _split_by_tokens(content: str) -> List[str]:
+        """Window the token stream once instead of re-scanning the text per separator"""
+        tokens = _token_encoding.encode(content)
+        step = CHUNK_TOKENS - CHUNK_OVERLAP_TOKENS
+        return [
+            _token_encoding.decode(tokens[i:i + CHUNK_TOKENS])
+            for i in range(0, max(len(tokens) - CHUNK_OVERLAP_TOKENS, 1), step)
+        ]
     
     def process_pdf(self, pdf_path: str, filename: str) -> ProcessingResult:
         """Process a PDF file and return structured document with chunks"""
         try:
-            # Extract text
             content = self.extract_text_from_pdf(pdf_path)
-            
+            return self.process_content(content, filename, pdf_path)
+        except Exception as e:
+            return ProcessingResult(
+                success=False,
+                error_message=str(e)
+            )
+
+    def process_pdf_bytes(self, data: bytes, filename: str) -> ProcessingResult:
+        """Process in-memory PDF bytes without writing them to disk"""
+        try:
+            content = self.extract_text_from_bytes(data)
+            return self.process_content(content, filename, "")
+        except Exception as e:
+            return ProcessingResult(
+                success=False,
+                error_message=str(e)
+            )
+
+    def process_content(self, content: str, filename: str, source_file: str = "",
+                        analysis: Optional[Dict[str, Any]] = None) -> ProcessingResult:
+        """Build the document and chunks for already-extracted text.
+
+        A precomputed analysis (e.g. from marshalled batch analysis) skips
+        the per-document analyze_document LLM call.
+        """
+        try:
             if not content.strip():
                 return ProcessingResult(
                     success=False,
                     error_message="No text content extracted from PDF"
                 )
-            
+
             # Generate document ID
             document_id = str(uuid.uuid4())
-            
-            # Classify document type
-            document_type = self.classify_document_type(content)
-            
-            # Extract parties and issues
-            parties, issues = self.extract_parties_and_issues(content)
+
+            # Classify document type and extract parties/issues in one LLM
+            # call, unless the caller already analyzed this document
+            if analysis is None:
+                analysis = self.analyze_document(content)
+            document_type = analysis["document_type"]
+            parties = analysis["parties"]
+            issues = analysis["issues"]
             
             # Create document
             document = LegalDocument(
@@ -167,7 +335,7 @@ class DocumentProcessor:
                 parties_involved=parties,
                 key_issues=issues,
                 metadata={
-                    "source_file": pdf_path,
+                    "source_file": source_file,
                     "word_count": len(content.split()),
                     "pages": len(content.split('\n\n'))
                 }
@@ -178,7 +346,8 @@ class DocumentProcessor:
                 "filename": filename,
                 "document_type": document_type.value,
                 "parties_involved": parties,
-                "key_issues": issues
+                "key_issues": issues,
+                "source_file": source_file
             }
             
             chunks = self.create_chunks(content, document_id, chunk_metadata)
@@ -13,7 +13,7 @@ from pathlib import Path
 # Add the current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from legal_ai_system import legal_ai_system
+from legal_ai_system import get_system
 
 def create_sample_legal_document():
     """Create a sample legal document for testing"""
@@ -60,7 +60,7 @@ def example_basic_usage():
     try:
         # Process the document
         print("🔍 Processing document...")
-        result = legal_ai_system.process_uploaded_pdf(sample_file)
+        result = get_system().process_uploaded_pdf(sample_file)
         
         if result["success"]:
             print("✅ Document processed successfully!")
@@ -107,7 +107,7 @@ def example_search_functionality():
     
     for query in search_queries:
         print(f"\n🔎 Searching for: '{query}'")
-        results = legal_ai_system.search_similar_documents(query, n_results=3)
+        results = get_system().search_similar_documents(query, n_results=3)
         
         if results:
             print(f"   Found {len(results)} relevant documents:")
@@ -122,7 +122,7 @@ def example_system_stats():
     print("=" * 50)
     
     try:
-        stats = legal_ai_system.get_system_stats()
+        stats = get_system().get_system_stats()
         
         print("📈 System Overview:")
         print(f"   Total Chunks: {stats.get('vector_store', {}).get('total_chunks', 0)}")
@@ -140,7 +140,7 @@ def example_response_generation():
     
     # Get the first document from the system
     try:
-        stats = legal_ai_system.get_system_stats()
+        stats = get_system().get_system_stats()
         total_chunks = stats.get('vector_store', {}).get('total_chunks', 0)
         
         if total_chunks > 0:
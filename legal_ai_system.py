@@ -1,19 +1,44 @@
+import logging
+import asyncio
+import json
 import os
+import sys
+import time
 import uuid
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 
+import numpy as np
+
 from config import settings
 from models import LegalDocument, LegalResponse, ProcessingResult
 from document_processor import DocumentProcessor
-from vector_store import ChromaVectorStore
+from semantic_cache import SemanticCache
+from vector_store import ChromaVectorStore, _embed_query
 from legal_agents import LegalAgentSystem
 
+logger = logging.getLogger(__name__)
+
+# Entries in the persistent response cache older than this are ignored
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+# LSH prefilter over the response cache: signature width and the maximum
+# Hamming distance still considered "possibly similar". At the cache
+# threshold (cosine >= 0.97, ~14 degrees) each random hyperplane separates
+# a true match with probability ~0.08, so ~2.5 of the 32 bits differ on
+# average; radius 4 keeps the prefilter's miss rate low while unrelated
+# documents (~16 differing bits) never pass
+LSH_BITS = 32
+LSH_MAX_HAMMING = 4
+
 class LegalAISystem:
     """Main legal AI system for document processing and response generation"""
     
     def __init__(self):
         """Initialize the legal AI system with all components"""
+        self._enable_llm_cache()
+
         self.vector_store = ChromaVectorStore()
         self.document_processor = DocumentProcessor()
         self.agent_system = LegalAgentSystem(self.vector_store)
@@ -21,7 +46,39 @@ class LegalAISystem:
         # Create uploads directory
         self.uploads_dir = Path("uploads")
         self.uploads_dir.mkdir(exist_ok=True)
+
+        # Semantic caches: near-duplicate queries/documents skip the
+        # vector search and LLM response pipeline entirely
+        self._search_cache = SemanticCache()
+        self._response_cache = SemanticCache()
+
+        # Random-projection LSH over the response cache: sign-bit signatures
+        # answer "could anything cached be close?" in-memory, so obviously
+        # novel documents (the common case) skip the Chroma query entirely
+        self._lsh_planes: Optional[np.ndarray] = None
+        self._lsh_signatures: List[int] = []
+        self._lsh_loaded = False
+
+        # Document-level metadata, built once per document rather than once
+        # per result row; strings are interned so the many repeated
+        # filename/document_type values share storage
+        self._doc_meta_cache: Dict[str, Dict[str, str]] = {}
     
+    @staticmethod
+    def _enable_llm_cache():
+        """Back all LLM calls with a SQLite cache keyed by (model, prompt)
+
+        Identical prompts - re-ingested documents, repeated analyses - are
+        then answered from disk across restarts instead of re-spending
+        tokens and latency.
+        """
+        try:
+            from langchain.cache import SQLiteCache
+            from langchain.globals import set_llm_cache
+            set_llm_cache(SQLiteCache(database_path=settings.llm_cache_path))
+        except Exception as e:
+            logger.exception("Error enabling LLM cache")
+
     def process_and_store_pdf(self, pdf_path: str, filename: Optional[str] = None) -> ProcessingResult:
         """Process a PDF file and store it in the vector database"""
         try:
@@ -30,37 +87,75 @@ class LegalAISystem:
             
             # Process the PDF
             result = self.document_processor.process_pdf(pdf_path, filename)
-            
-            if not result.success:
-                return result
-            
-            # Store chunks in vector database
-            if result.chunks:
-                storage_success = self.vector_store.add_chunks(result.chunks)
-                if not storage_success:
-                    result.success = False
-                    result.error_message = "Failed to store document in vector database"
-            
-            return result
-            
+            return self._store_result(result)
+
         except Exception as e:
             return ProcessingResult(
                 success=False,
                 error_message=str(e)
             )
-    
+
+    def process_and_store_pdf_bytes(self, data: bytes, filename: str) -> ProcessingResult:
+        """Process in-memory PDF bytes and store them in the vector database"""
+        try:
+            result = self.document_processor.process_pdf_bytes(data, filename)
+            return self._store_result(result)
+
+        except Exception as e:
+            return ProcessingResult(
+                success=False,
+                error_message=str(e)
+            )
+
+    def _store_result(self, result: ProcessingResult) -> ProcessingResult:
+        """Store a successful processing result's chunks in the vector database"""
+        if not result.success:
+            return result
+
+        if result.chunks:
+            storage_success = self.vector_store.upsert_chunks(result.chunks)
+            if not storage_success:
+                result.success = False
+                result.error_message = "Failed to store document in vector database"
+            else:
+                # Cached search results predate this document and would keep
+                # it invisible to near-duplicate queries
+                self._search_cache.clear()
+
+        return result
+
+    def delete_document(self, document_id: str) -> bool:
+        """Delete a document, dropping cached results that may reference it"""
+        success = self.vector_store.delete_document(document_id)
+        if success:
+            # Cached searches and responses may still carry the deleted
+            # document's chunks; flush them rather than serving stale hits
+            self._search_cache.clear()
+            self._response_cache.clear()
+            self._doc_meta_cache.pop(document_id, None)
+        return success
+
     def generate_response_for_document(self, document_id: str, response_type: str = "professional") -> Optional[LegalResponse]:
         """Generate a legal response for a specific document"""
         try:
             # Get document chunks from vector store
             chunks = self.vector_store.get_document_chunks(document_id)
-            
+
             if not chunks:
-                print(f"No document found with ID: {document_id}")
+                logger.warning("No document found with ID: %s", document_id)
                 return None
-            
-            # Reconstruct document content
-            content = "\n".join([chunk.content for chunk in chunks])
+
+            # Reconstruct document content in original chunk order (Chroma's
+            # get() does not guarantee insertion order), joining straight from
+            # a generator instead of building an intermediate list
+            chunks.sort(key=lambda chunk: chunk.metadata.get("chunk_index", 0))
+            content = "\n".join(chunk.content for chunk in chunks)
+
+            # Return a cached response for semantically near-identical documents
+            content_embedding = _embed_query(self.vector_store.embedding_model, content[:2000])
+            cached = self._response_cache.get(content_embedding)
+            if cached is not None and cached[0] == response_type:
+                return cached[1]
             
             # Get metadata from first chunk
             metadata = chunks[0].metadata
@@ -78,26 +173,34 @@ class LegalAISystem:
             
             # Generate response
             response = self.agent_system.generate_legal_response(document, response_type)
+            self._response_cache.put(content_embedding, (response_type, response))
             return response
             
         except Exception as e:
-            print(f"Error generating response: {e}")
+            logger.exception("Error generating response")
             return None
     
     def search_similar_documents(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
         """Search for similar documents in the knowledge base"""
         try:
+            # Serve near-duplicate queries straight from the semantic cache
+            query_embedding = _embed_query(self.vector_store.embedding_model, query.strip())
+            cached = self._search_cache.get(query_embedding)
+            if cached is not None and cached[0] == n_results:
+                return cached[1]
+
             results = self.vector_store.search_similar(query, n_results)
-            
+
             # Group results by document
             document_results = {}
             for result in results:
                 doc_id = result.document_id
                 if doc_id not in document_results:
+                    doc_meta = self._get_doc_meta(doc_id, result.metadata)
                     document_results[doc_id] = {
                         "document_id": doc_id,
-                        "filename": result.metadata.get("filename", "Unknown"),
-                        "document_type": result.metadata.get("document_type", "Unknown"),
+                        "filename": doc_meta["filename"],
+                        "document_type": doc_meta["document_type"],
                         "similarity_score": result.similarity_score,
                         "relevant_chunks": []
                     }
@@ -107,12 +210,25 @@ class LegalAISystem:
                     "similarity": result.similarity_score
                 })
             
-            return list(document_results.values())
-            
+            search_results = list(document_results.values())
+            self._search_cache.put(query_embedding, (n_results, search_results))
+            return search_results
+
         except Exception as e:
-            print(f"Error searching documents: {e}")
+            logger.exception("Error searching documents")
             return []
     
+    def _get_doc_meta(self, document_id: str, metadata: Dict[str, Any]) -> Dict[str, str]:
+        """Get (or build and cache) interned document-level metadata"""
+        doc_meta = self._doc_meta_cache.get(document_id)
+        if doc_meta is None:
+            doc_meta = {
+                "filename": sys.intern(str(metadata.get("filename", "Unknown"))),
+                "document_type": sys.intern(str(metadata.get("document_type", "Unknown")))
+            }
+            self._doc_meta_cache[document_id] = doc_meta
+        return doc_meta
+
     def get_system_stats(self) -> Dict[str, Any]:
         """Get system statistics"""
         try:
@@ -121,28 +237,131 @@ class LegalAISystem:
             return {
                 "vector_store": vector_stats,
                 "uploads_directory": str(self.uploads_dir),
-                "model_name": settings.model_name
+                "model_name": settings.model_name,
+                "semantic_cache": {
+                    "search": self._search_cache.stats(),
+                    "response": self._response_cache.stats()
+                }
             }
             
         except Exception as e:
             return {"error": str(e)}
     
+    def _lsh_signature(self, embedding: List[float]) -> int:
+        """Hash an embedding to a sign-bit signature of its random projections"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self._lsh_planes is None:
+            # Fixed seed: signatures must be comparable across restarts
+            rng = np.random.default_rng(0)
+            self._lsh_planes = rng.standard_normal((LSH_BITS, vector.shape[0])).astype(np.float32)
+
+        signature = 0
+        for value in self._lsh_planes @ vector:
+            signature = (signature << 1) | int(value > 0)
+        return signature
+
+    def _lsh_may_match(self, signature: int) -> bool:
+        """Check whether any cached signature is within LSH_MAX_HAMMING bits"""
+        if not self._lsh_loaded:
+            try:
+                records = self.vector_store.response_collection.get(include=["embeddings"])
+                embeddings = records.get("embeddings")
+                if embeddings is not None:
+                    self._lsh_signatures = [self._lsh_signature(e) for e in embeddings]
+            except Exception:
+                logger.exception("Error loading response cache signatures")
+            self._lsh_loaded = True
+
+        return any(
+            bin(signature ^ cached).count("1") <= LSH_MAX_HAMMING
+            for cached in self._lsh_signatures
+        )
+
+    def _lookup_cached_result(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Look up a semantically near-identical prior result in the
+        persistent response cache; None on miss, low similarity or expiry"""
+        try:
+            # O(cache size) integer scan; only Hamming-close signatures are
+            # worth the actual similarity query
+            if not self._lsh_may_match(self._lsh_signature(embedding)):
+                return None
+            results = self.vector_store.response_collection.query(
+                query_embeddings=[embedding],
+                n_results=1,
+                include=["documents", "metadatas", "distances"]
+            )
+            if not results["ids"][0]:
+                return None
+            if 1 - results["distances"][0][0] < settings.semantic_cache_threshold:
+                return None
+            if time.time() - results["metadatas"][0][0].get("ts", 0) > RESPONSE_CACHE_TTL_SECONDS:
+                return None
+            return json.loads(results["documents"][0][0])
+        except Exception:
+            logger.exception("Error reading response cache")
+            return None
+
+    def _store_cached_result(self, embedding: List[float], payload: Dict[str, Any]) -> None:
+        """Store a pipeline result in the persistent response cache"""
+        try:
+            self.vector_store.response_collection.add(
+                ids=[str(uuid.uuid4())],
+                embeddings=[embedding],
+                documents=[json.dumps(payload, default=str)],
+                metadatas=[{"ts": time.time()}]
+            )
+            self._lsh_signatures.append(self._lsh_signature(embedding))
+        except Exception:
+            logger.exception("Error writing response cache")
+
     def process_uploaded_pdf(self, file_path: str) -> Dict[str, Any]:
         """Process an uploaded PDF file and generate a response"""
         try:
-            # Process and store the PDF
             result = self.process_and_store_pdf(file_path)
-            
+            return self._build_upload_payload(result)
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    def process_uploaded_pdf_bytes(self, data: bytes, filename: str) -> Dict[str, Any]:
+        """Process uploaded PDF bytes and generate a response, without the
+        temp-file round-trip through disk"""
+        try:
+            result = self.process_and_store_pdf_bytes(data, filename)
+            return self._build_upload_payload(result)
+
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    def _build_upload_payload(self, result: ProcessingResult) -> Dict[str, Any]:
+        """Build the upload response payload, serving near-duplicate documents
+        from the persistent response cache"""
+        try:
             if not result.success:
                 return {
                     "success": False,
                     "error": result.error_message
                 }
-            
+
+            # A semantically near-identical document processed before (within
+            # the TTL) skips the LLM response generation entirely
+            content_embedding = list(
+                _embed_query(self.vector_store.embedding_model, result.document.content[:2000])
+            )
+            cached = self._lookup_cached_result(content_embedding)
+            if cached is not None:
+                return cached
+
             # Generate response
             response = self.generate_response_for_document(result.document.id)
-            
-            return {
+
+            payload = {
                 "success": True,
                 "document": {
                     "id": result.document.id,
@@ -159,34 +378,156 @@ class LegalAISystem:
                 } if response else None,
                 "chunks_created": len(result.chunks)
             }
-            
+
+            self._store_cached_result(content_embedding, payload)
+            return payload
+
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e)
             }
-    
+
     def batch_process_pdfs(self, pdf_paths: List[str]) -> List[Dict[str, Any]]:
-        """Process multiple PDF files in batch"""
-        results = []
-        
-        for pdf_path in pdf_paths:
-            try:
+        """Process multiple PDF files in batch, marshalling document analysis
+        into one LLM call per MARSHALLED_BATCH_SIZE documents"""
+        contents = {pdf_path: self._extract_one_content(pdf_path) for pdf_path in pdf_paths}
+        analyses = self._marshal_batch_analyses(contents)
+
+        outcomes = [
+            self._process_one_for_batch(pdf_path, contents, analyses)
+            for pdf_path in pdf_paths
+        ]
+
+        results = [entry for entry, _ in outcomes]
+        self._maybe_submit_response_batch(
+            results, [document for _, document in outcomes if document is not None]
+        )
+        return results
+
+    def _extract_one_content(self, pdf_path: str) -> Optional[str]:
+        """Extract text for batch analysis; None defers the failure to the
+        per-file processing path, which reports it properly"""
+        try:
+            return self.document_processor.extract_text_from_pdf(pdf_path)
+        except Exception:
+            logger.exception("Error extracting %s for batch analysis", pdf_path)
+            return None
+
+    def _marshal_batch_analyses(self, contents: Dict[str, Optional[str]]) -> Dict[str, Dict[str, Any]]:
+        """Run marshalled analysis over the extracted batch contents: one LLM
+        call per MARSHALLED_BATCH_SIZE documents instead of one per document"""
+        extracted = {path: content for path, content in contents.items() if content}
+        if len(extracted) < 2:
+            return {}
+        return self.agent_system.run_analysis_marshalled(extracted)
+
+    def _process_one_for_batch(self, pdf_path: str,
+                               contents: Optional[Dict[str, Optional[str]]] = None,
+                               analyses: Optional[Dict[str, Dict[str, Any]]] = None) -> tuple:
+        """Process a single PDF; returns the batch summary entry and the
+        stored document (None on failure).
+
+        Pre-extracted content and marshalled analysis are reused when the
+        batch pipeline provides them, so the per-document analysis LLM call
+        is skipped.
+        """
+        try:
+            content = (contents or {}).get(pdf_path)
+            if content is not None:
+                marshalled = (analyses or {}).get(pdf_path)
+                analysis = self.document_processor.analysis_from_entry(marshalled) if marshalled else None
+                result = self._store_result(
+                    self.document_processor.process_content(
+                        content, os.path.basename(pdf_path), pdf_path, analysis
+                    )
+                )
+            else:
                 result = self.process_and_store_pdf(pdf_path)
-                results.append({
-                    "file": pdf_path,
-                    "success": result.success,
-                    "document_id": result.document.id if result.document else None,
-                    "error": result.error_message if not result.success else None
-                })
-            except Exception as e:
-                results.append({
-                    "file": pdf_path,
-                    "success": False,
-                    "error": str(e)
-                })
-        
+
+            entry = {
+                "file": pdf_path,
+                "success": result.success,
+                "document_id": result.document.id if result.document else None,
+                "error": result.error_message if not result.success else None
+            }
+            return entry, result.document if result.success else None
+        except Exception as e:
+            return {
+                "file": pdf_path,
+                "success": False,
+                "error": str(e)
+            }, None
+
+    def _maybe_submit_response_batch(self, results: List[Dict[str, Any]],
+                                     documents: List[LegalDocument]) -> None:
+        """When settings.use_batch_api is set, queue response generation for
+        the stored documents via the OpenAI Batch API.
+
+        The batch id is recorded on each successful entry so the caller can
+        poll collect_batch_responses instead of paying per-request pricing
+        and rate limits for offline ingestion.
+        """
+        if not settings.use_batch_api or not documents:
+            return
+
+        batch_id = self.agent_system.submit_batch(documents)
+        if batch_id is None:
+            return
+
+        for entry in results:
+            if entry["success"]:
+                entry["response_batch_id"] = batch_id
+
+    def collect_batch_responses(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        """Collect responses from a Batch API submission, mapped by document
+        id; empty while the batch is still running"""
+        return {
+            document_id: {
+                "suggested_response": response.suggested_response,
+                "confidence_score": response.confidence_score,
+                "reasoning": response.reasoning,
+                "key_points": response.key_points
+            }
+            for document_id, response in self.agent_system.collect_batch(batch_id).items()
+        }
+
+    async def aprocess_and_store_pdf(self, pdf_path: str, filename: Optional[str] = None) -> ProcessingResult:
+        """Async wrapper around process_and_store_pdf for concurrent pipelines"""
+        return await asyncio.to_thread(self.process_and_store_pdf, pdf_path, filename)
+
+    async def abatch_process_pdfs(self, pdf_paths: List[str]) -> List[Dict[str, Any]]:
+        """Process multiple PDF files concurrently under a concurrency bound,
+        marshalling document analysis across the batch"""
+        semaphore = asyncio.Semaphore(settings.max_concurrency)
+
+        async def extract_one(pdf_path: str) -> tuple:
+            async with semaphore:
+                return pdf_path, await asyncio.to_thread(self._extract_one_content, pdf_path)
+
+        contents = dict(await asyncio.gather(*[extract_one(p) for p in pdf_paths]))
+        analyses = await asyncio.to_thread(self._marshal_batch_analyses, contents)
+
+        async def process_one(pdf_path: str) -> tuple:
+            async with semaphore:
+                return await asyncio.to_thread(
+                    self._process_one_for_batch, pdf_path, contents, analyses
+                )
+
+        outcomes = await asyncio.gather(*[process_one(p) for p in pdf_paths])
+
+        results = [entry for entry, _ in outcomes]
+        self._maybe_submit_response_batch(
+            results, [document for _, document in outcomes if document is not None]
+        )
         return results
 
-# Global system instance
-legal_ai_system = LegalAISystem() 
+@lru_cache(maxsize=1)
+def get_system() -> LegalAISystem:
+    """Build the shared system instance once, on first use.
+
+    Importing this module no longer loads the embedding model, opens the
+    Chroma client and builds the agent system as an import side effect -
+    that now happens on the first call.
+    """
+    return LegalAISystem()
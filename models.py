@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -12,6 +12,8 @@ class DocumentType(str, Enum):
 
 class LegalDocument(BaseModel):
     """Model for legal document structure"""
+    model_config = ConfigDict(frozen=True)
+
     id: str = Field(description="Unique document identifier")
     filename: str = Field(description="Original filename")
     content: str = Field(description="Extracted text content")
@@ -23,6 +25,8 @@ class LegalDocument(BaseModel):
     
 class LegalResponse(BaseModel):
     """Model for AI-generated legal response"""
+    model_config = ConfigDict(frozen=True)
+
     document_id: str = Field(description="Reference to original document")
     response_type: str = Field(description="Type of response (acknowledgment, counter, etc.)")
     suggested_response: str = Field(description="AI-generated response text")
@@ -42,13 +46,25 @@ class DocumentChunk(BaseModel):
     embedding: Optional[List[float]] = Field(default=None, description="Vector embedding")
 
 class SearchResult(BaseModel):
-    """Model for search results from vector DB"""
+    """Model for search results from vector DB
+
+    Frozen and hashable; built with model_construct in vector store hot
+    loops since the fields come straight from our own collection.
+    """
+    model_config = ConfigDict(frozen=True)
+
     chunk_id: str = Field(description="Chunk identifier")
     document_id: str = Field(description="Parent document ID")
     content: str = Field(description="Chunk content")
     similarity_score: float = Field(description="Similarity score")
     metadata: Dict[str, Any] = Field(description="Chunk metadata")
 
+class EvaluationResult(BaseModel):
+    """Model for LLM self-evaluation of a generated response"""
+    confidence: float = Field(description="Confidence in the response quality", ge=0.0, le=1.0)
+    reasoning: str = Field(description="Reasoning for the confidence score")
+    key_points: List[str] = Field(default_factory=list, description="Key points addressed in the response")
+
 class ProcessingResult(BaseModel):
     """Model for document processing results"""
     success: bool = Field(description="Processing success status")
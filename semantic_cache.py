@@ -0,0 +1,68 @@
+from typing import Any, List, Optional
+import numpy as np
+
+from config import settings
+
+class SemanticCache:
+    """In-memory similarity cache for expensive search/LLM results.
+
+    Instead of exact key matching, a lookup returns the stored value whose
+    embedding has cosine similarity above the configured threshold with the
+    query embedding, so near-duplicate queries skip the expensive path.
+    """
+
+    def __init__(self, max_size: int = 10000, threshold: Optional[float] = None):
+        self.max_size = max_size
+        self.threshold = settings.semantic_cache_threshold if threshold is None else threshold
+        self._embeddings: List[np.ndarray] = []
+        self._values: List[Any] = []
+        self._matrix: Optional[np.ndarray] = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, embedding) -> Optional[Any]:
+        """Return the cached value nearest to the embedding, if close enough"""
+        if not self._embeddings:
+            self.misses += 1
+            return None
+
+        if self._matrix is None:
+            self._matrix = np.stack(self._embeddings)
+
+        scores = self._matrix @ self._normalize(embedding)
+        best = int(np.argmax(scores))
+
+        if scores[best] >= self.threshold:
+            self.hits += 1
+            return self._values[best]
+
+        self.misses += 1
+        return None
+
+    def put(self, embedding, value: Any) -> None:
+        """Store a value under its embedding, evicting the oldest entry when full"""
+        if len(self._values) >= self.max_size:
+            self._embeddings.pop(0)
+            self._values.pop(0)
+        self._embeddings.append(self._normalize(embedding))
+        self._values.append(value)
+        self._matrix = None
+
+    def clear(self) -> None:
+        """Drop every entry, e.g. after the underlying corpus changes"""
+        self._embeddings = []
+        self._values = []
+        self._matrix = None
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._values),
+            "hits": self.hits,
+            "misses": self.misses
+        }
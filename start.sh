@@ -51,8 +51,9 @@ else
         echo "2. Start Streamlit interface"
         echo "3. Run example usage"
         echo "4. Start both API and Streamlit"
+        echo "5. Start production API server (gunicorn)"
         echo ""
-        read -p "Enter your choice (1-4): " choice
+        read -p "Enter your choice (1-5): " choice
         
         case $choice in
             1)
@@ -83,6 +84,11 @@ else
                 echo "Stopping API server..."
                 kill $API_PID
                 ;;
+            5)
+                WORKERS=${WEB_CONCURRENCY:-$((2 * $(nproc) + 1))}
+                echo "🚀 Starting production API server with $WORKERS workers..."
+                gunicorn -k uvicorn.workers.UvicornWorker -w "$WORKERS" -b 0.0.0.0:8000 api:app
+                ;;
             *)
                 echo "❌ Invalid choice"
                 exit 1
@@ -1,11 +1,26 @@
 import streamlit as st
-import os
-import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import json
 from typing import Dict, Any
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-from legal_ai_system import legal_ai_system
+from legal_ai_system import get_system as _build_system
+
+@st.cache_resource
+def get_system():
+    """Share one system instance (embedding model, Chroma client, agents)
+    across sessions and reruns instead of rebuilding per worker"""
+    return _build_system()
+
+def _dumps_pretty(obj) -> bytes:
+    """Serialize download payloads, preferring orjson's C implementation"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode("utf-8")
 
 # Page configuration
 st.set_page_config(
@@ -93,17 +108,11 @@ def upload_and_process_page():
         if st.button("🚀 Process Document & Generate Response", type="primary"):
             with st.spinner("Processing document..."):
                 try:
-                    # Save uploaded file temporarily
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                        tmp_file.write(uploaded_file.getvalue())
-                        tmp_file_path = tmp_file.name
-                    
-                    # Process the document
-                    result = legal_ai_system.process_uploaded_pdf(tmp_file_path)
-                    
-                    # Clean up temp file
-                    os.unlink(tmp_file_path)
-                    
+                    # Process the uploaded bytes directly, no temp file on disk
+                    result = get_system().process_uploaded_pdf_bytes(
+                        uploaded_file.getvalue(), uploaded_file.name
+                    )
+
                     if result["success"]:
                         st.success("✅ Document processed successfully!")
                         
@@ -158,7 +167,7 @@ def upload_and_process_page():
                         
                         st.download_button(
                             label="📥 Download Response as JSON",
-                            data=json.dumps(response_data, indent=2),
+                            data=_dumps_pretty(response_data),
                             file_name=f"legal_response_{result['document']['id']}.json",
                             mime="application/json"
                         )
@@ -184,7 +193,7 @@ def search_documents_page():
     if st.button("🔍 Search", type="primary") and query:
         with st.spinner("Searching..."):
             try:
-                results = legal_ai_system.search_similar_documents(query, n_results)
+                results = get_system().search_similar_documents(query, n_results)
                 
                 if results:
                     st.success(f"✅ Found {len(results)} relevant documents")
@@ -213,7 +222,7 @@ def system_stats_page():
     if st.button("🔄 Refresh Stats", type="primary"):
         with st.spinner("Loading statistics..."):
             try:
-                stats = legal_ai_system.get_system_stats()
+                stats = get_system().get_system_stats()
                 
                 col1, col2, col3 = st.columns(3)
                 
@@ -264,26 +273,37 @@ def batch_processing_page():
             with st.spinner("Processing files..."):
                 try:
                     results = []
-                    
-                    for uploaded_file in uploaded_files:
-                        # Save uploaded file temporarily
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                            tmp_file.write(uploaded_file.getvalue())
-                            tmp_file_path = tmp_file.name
-                        
-                        # Process the document
-                        result = legal_ai_system.process_uploaded_pdf(tmp_file_path)
-                        
-                        # Clean up temp file
-                        os.unlink(tmp_file_path)
-                        
-                        results.append({
-                            "filename": uploaded_file.name,
-                            "success": result["success"],
-                            "document_id": result.get("document", {}).get("id") if result["success"] else None,
-                            "error": result.get("error") if not result["success"] else None
-                        })
-                    
+                    progress = st.progress(0.0)
+
+                    # Process files concurrently: PDF parsing and the torch
+                    # encoder both release the GIL, so threads overlap well.
+                    # Streamlit calls stay on this thread - the workers only
+                    # run the processing pipeline.
+                    with ThreadPoolExecutor(max_workers=min(8, len(uploaded_files))) as executor:
+                        futures = {
+                            executor.submit(
+                                get_system().process_uploaded_pdf_bytes,
+                                uploaded_file.getvalue(),
+                                uploaded_file.name
+                            ): uploaded_file.name
+                            for uploaded_file in uploaded_files
+                        }
+
+                        for done, future in enumerate(as_completed(futures), 1):
+                            filename = futures[future]
+                            try:
+                                result = future.result()
+                            except Exception as e:
+                                result = {"success": False, "error": str(e)}
+
+                            results.append({
+                                "filename": filename,
+                                "success": result["success"],
+                                "document_id": result.get("document", {}).get("id") if result["success"] else None,
+                                "error": result.get("error") if not result["success"] else None
+                            })
+                            progress.progress(done / len(uploaded_files))
+
                     # Display results
                     successful = len([r for r in results if r["success"]])
                     failed = len(results) - successful
@@ -302,7 +322,7 @@ def batch_processing_page():
                     # Download results
                     st.download_button(
                         label="📥 Download Results as JSON",
-                        data=json.dumps(results, indent=2),
+                        data=_dumps_pretty(results),
                         file_name="batch_processing_results.json",
                         mime="application/json"
                     )
@@ -11,7 +11,7 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
 
-from legal_ai_system import legal_ai_system
+from legal_ai_system import get_system
 from vector_store import ChromaVectorStore
 from document_processor import DocumentProcessor
 
@@ -160,7 +160,7 @@ def test_pdf_upload_and_storage():
         
         # Step 5: Test full system integration
         print("\n🤖 Testing full system integration...")
-        system_result = legal_ai_system.process_uploaded_pdf(pdf_path)
+        system_result = get_system().process_uploaded_pdf(pdf_path)
         
         if system_result["success"]:
             print("✅ Full system integration successful!")
@@ -174,7 +174,7 @@ def test_pdf_upload_and_storage():
         
         # Step 6: Get system stats
         print("\n📊 System Statistics:")
-        stats = legal_ai_system.get_system_stats()
+        stats = get_system().get_system_stats()
         print(f"   - Total chunks in vector store: {stats.get('vector_store', {}).get('total_chunks', 0)}")
         print(f"   - Collection name: {stats.get('vector_store', {}).get('collection_name', 'Unknown')}")
         print(f"   - Model: {stats.get('model_name', 'Unknown')}")
@@ -1,6 +1,13 @@
+import logging
+import asyncio
 import chromadb
 from chromadb.config import Settings as ChromaSettings
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
+import hashlib
+import json
+import os
+import sqlite3
 import uuid
 from sentence_transformers import SentenceTransformer
 import numpy as np
@@ -8,104 +15,674 @@ import numpy as np
 from config import settings
 from models import DocumentChunk, SearchResult
 
+logger = logging.getLogger(__name__)
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+except ImportError:
+    ORTModelForFeatureExtraction = None
+
+# Corpus size above which the FAISS index switches from exact flat search to HNSW
+FAISS_HNSW_THRESHOLD = 100_000
+
+# Corpus size above which HNSW's per-vector graph overhead stops fitting in
+# memory and the index switches to IVF with product quantization
+FAISS_IVFPQ_THRESHOLD = 1_000_000
+
+# Collections at or below this size are searched brute-force when FAISS is
+# unavailable: one BLAS matmul beats an HNSW graph walk at this scale
+BRUTEFORCE_MAX_CHUNKS = 10_000
+
+# Oversampling factor for the Chroma fallback: fetch k * this many candidates
+# from the approximate index, then rerank them with exact cosine scores
+RERANK_OVERSAMPLE = 4
+
+def _cosine_scores(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every row in matrix against query"""
+    norms = np.sqrt((matrix * matrix).sum(axis=1)) * np.sqrt(query @ query)
+    norms = np.where(norms == 0.0, 1.0, norms)
+    return (matrix @ query) / norms
+
+if njit is not None:
+    # JIT-compile the scoring kernel when numba is installed; the numpy
+    # version above stays as the fallback implementation
+    _cosine_scores = njit(cache=True)(_cosine_scores)
+
+def _topk_cosine(matrix: np.ndarray, query: np.ndarray, k: int) -> tuple:
+    """Exact cosine top-k over a candidate matrix: (row indices, scores)"""
+    scores = _cosine_scores(matrix, query)
+    if k >= scores.shape[0]:
+        order = np.argsort(-scores)
+    else:
+        top = np.argpartition(-scores, k)[:k]
+        order = top[np.argsort(-scores[top])]
+    return order, scores[order]
+
+class _OnnxEncoder:
+    """encode()-compatible wrapper around an ONNX-exported encoder.
+
+    ONNX Runtime's graph-optimized CPU kernels encode several times faster
+    than PyTorch's eager path for MiniLM-class models.
+    """
+
+    def __init__(self, model_name: str):
+        repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        self.tokenizer = AutoTokenizer.from_pretrained(repo)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(repo, export=True)
+
+    def encode(self, texts, batch_size: int = 64, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, normalize_embeddings: bool = False):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=256,
+                return_tensors="np"
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            # Mean-pool over real tokens, matching SentenceTransformer pooling
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            batches.append((hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9))
+
+        matrix = np.concatenate(batches).astype(np.float32)
+        if normalize_embeddings:
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return matrix[0] if single else matrix
+
+@lru_cache(maxsize=2)
+def _get_embedding_model(name: str):
+    """Load each embedding model once per process; every store instance and
+    script sharing the process reuses the same weights"""
+    if settings.embedding_backend == "onnx" and ORTModelForFeatureExtraction is not None:
+        try:
+            return _OnnxEncoder(name)
+        except Exception:
+            logger.exception("Error loading ONNX encoder, falling back to SentenceTransformer")
+    return SentenceTransformer(name)
+
+@lru_cache(maxsize=4096)
+def _embed_query(model: SentenceTransformer, text: str) -> tuple:
+    """Embed a query string, cached because query distributions are heavily skewed"""
+    return tuple(model.encode(text, normalize_embeddings=True).tolist())
+
 class ChromaVectorStore:
     """ChromaDB vector store for legal document chunks"""
     
     def __init__(self):
+        os.makedirs(settings.chroma_db_path, exist_ok=True)
+
         self.client = chromadb.PersistentClient(
             path=settings.chroma_db_path,
             settings=ChromaSettings(anonymized_telemetry=False)
         )
         
-        # Initialize embedding model
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Initialize local embedding model (no per-request API latency or cost)
+        self.embedding_model = _get_embedding_model(settings.embedding_model)
         
-        # Get or create collection
-        self.collection = self.client.get_or_create_collection(
-            name="legal_documents",
-            metadata={"description": "Legal document chunks with embeddings"}
+        # Get or create collection, migrating legacy L2 collections to cosine
+        self.collection = self._get_or_create_collection()
+
+        # Persistent semantic cache of pipeline results, keyed by document
+        # embedding; survives restarts unlike the in-memory caches
+        self.response_collection = self._get_or_create_response_collection()
+
+        # In-memory FAISS index over the persisted vectors, built lazily and
+        # invalidated whenever the collection changes
+        self._faiss_index = None
+        self._faiss_ids: List[str] = []
+
+        # Row-normalized embedding matrix for the brute-force search path,
+        # built lazily and invalidated alongside the FAISS index
+        self._cached_matrix: Optional[np.ndarray] = None
+        self._cached_matrix_ids: List[str] = []
+
+        # On-disk embedding cache keyed by content hash, so identical text
+        # re-ingested across sessions skips the transformer forward pass
+        self._emb_cache = sqlite3.connect(
+            os.path.join(settings.chroma_db_path, "emb_cache.db"),
+            check_same_thread=False
         )
-    
+        self._emb_cache.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (h BLOB PRIMARY KEY, v BLOB)"
+        )
+        self._emb_cache.commit()
+
+    @staticmethod
+    def _make_metadata(extra: Dict[str, Any], document_id: str,
+                       chunk_index: int, embedding_model: str) -> Dict[str, Any]:
+        """Build chunk metadata in one literal-dict construction, overlaying
+        the identity keys on the already-coerced extra fields"""
+        return {
+            **extra,
+            "document_id": document_id,
+            "chunk_index": chunk_index,
+            "embedding_model": embedding_model
+        }
+
+    @staticmethod
+    def _text_hash(text: str) -> bytes:
+        """Hash text into the embedding-cache key"""
+        return hashlib.blake2b(text.encode("utf-8", "ignore"), digest_size=16).digest()
+
+    def _emb_cache_get(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Fetch cached embeddings for the given keys; missing keys are absent"""
+        try:
+            placeholders = ",".join("?" * len(keys))
+            rows = self._emb_cache.execute(
+                f"SELECT h, v FROM embeddings WHERE h IN ({placeholders})", keys
+            ).fetchall()
+            return {h: np.frombuffer(v, dtype=np.float32) for h, v in rows}
+        except Exception:
+            logger.exception("Error reading embedding cache")
+            return {}
+
+    def _emb_cache_put(self, entries: List[tuple]) -> None:
+        """Store (key, vector) pairs in the embedding cache"""
+        try:
+            self._emb_cache.executemany(
+                "INSERT OR IGNORE INTO embeddings (h, v) VALUES (?, ?)",
+                [(h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in entries]
+            )
+            self._emb_cache.commit()
+        except Exception:
+            logger.exception("Error writing embedding cache")
+
+    # HNSW metadata for the chunk collection. Every vector is unit-normalized
+    # at insert, so inner product equals cosine similarity without the
+    # per-comparison norm computation cosine space pays per query. The graph
+    # parameters trade a one-time indexing cost for higher recall on a corpus
+    # that grows slowly but is queried repeatedly: denser graph (M), wider
+    # build frontier (construction_ef) and wider query frontier (search_ef)
+    # than the 16/100/10 defaults
+    _COLLECTION_NAME = "legal_documents"
+    _COLLECTION_METADATA = {
+        "description": "Legal document chunks with embeddings",
+        "hnsw:space": "ip",
+        "hnsw:M": 32,
+        "hnsw:construction_ef": 200,
+        "hnsw:search_ef": 64
+    }
+
+    @staticmethod
+    def _normalize_rows(vectors) -> np.ndarray:
+        """Unit-normalize a batch of vectors"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _get_or_create_collection(self):
+        """Get the chunk collection, rebuilding legacy L2-space collections once"""
+        try:
+            existing = self.client.get_collection(self._COLLECTION_NAME)
+        except Exception:
+            return self.client.get_or_create_collection(
+                name=self._COLLECTION_NAME,
+                metadata=self._COLLECTION_METADATA
+            )
+
+        metadata = existing.metadata or {}
+        if metadata.get("hnsw:space") == "ip" and metadata.get("hnsw:M") == 32:
+            return existing
+
+        # One-time migration: pull everything out, recreate in inner-product
+        # space and re-add the stored vectors unit-normalized
+        records = existing.get(include=["documents", "metadatas", "embeddings"])
+        self.client.delete_collection(self._COLLECTION_NAME)
+        collection = self.client.create_collection(
+            name=self._COLLECTION_NAME,
+            metadata=self._COLLECTION_METADATA
+        )
+        if records["ids"]:
+            collection.add(
+                ids=records["ids"],
+                embeddings=self._normalize_rows(records["embeddings"]).tolist(),
+                documents=records["documents"],
+                metadatas=records["metadatas"]
+            )
+        return collection
+
+    # Cosine space so 1 - distance is the similarity the cache threshold in
+    # settings.semantic_cache_threshold is expressed in; the Chroma default
+    # (L2) would silently tighten the threshold for unit-norm vectors
+    _RESPONSE_COLLECTION_NAME = "response_cache"
+    _RESPONSE_COLLECTION_METADATA = {
+        "description": "Cached pipeline results keyed by document embedding",
+        "hnsw:space": "cosine"
+    }
+
+    def _get_or_create_response_collection(self):
+        """Get the response cache, rebuilding legacy L2-space caches once"""
+        try:
+            existing = self.client.get_collection(self._RESPONSE_COLLECTION_NAME)
+        except Exception:
+            return self.client.get_or_create_collection(
+                name=self._RESPONSE_COLLECTION_NAME,
+                metadata=self._RESPONSE_COLLECTION_METADATA
+            )
+
+        metadata = existing.metadata or {}
+        if metadata.get("hnsw:space") == "cosine":
+            return existing
+
+        # One-time migration: recreate in cosine space and carry the cached
+        # entries over so they keep their remaining TTL
+        records = existing.get(include=["documents", "metadatas", "embeddings"])
+        self.client.delete_collection(self._RESPONSE_COLLECTION_NAME)
+        collection = self.client.create_collection(
+            name=self._RESPONSE_COLLECTION_NAME,
+            metadata=self._RESPONSE_COLLECTION_METADATA
+        )
+        if records["ids"]:
+            collection.add(
+                ids=records["ids"],
+                embeddings=records["embeddings"],
+                documents=records["documents"],
+                metadatas=records["metadatas"]
+            )
+        return collection
+
+    def _invalidate_faiss_index(self) -> None:
+        """Drop the derived in-memory indexes after the collection changes"""
+        self._faiss_index = None
+        self._faiss_ids = []
+        self._cached_matrix = None
+        self._cached_matrix_ids = []
+
+    def _get_faiss_index(self):
+        """Build (or reuse) the FAISS index from the vectors stored in Chroma"""
+        if self._faiss_index is None:
+            results = self.collection.get(include=["embeddings"])
+            ids = results["ids"]
+            if not ids:
+                return None, []
+
+            vectors = np.asarray(results["embeddings"], dtype=np.float32)
+            faiss.normalize_L2(vectors)
+
+            dim = vectors.shape[1]
+            if len(ids) > FAISS_IVFPQ_THRESHOLD:
+                # 48 subquantizers x 8 bits: 48 bytes per vector instead of
+                # 4 * dim, at a small recall cost acceptable at this scale
+                nlist = min(4096, int(4 * len(ids) ** 0.5))
+                quantizer = faiss.IndexFlatIP(dim)
+                index = faiss.IndexIVFPQ(quantizer, dim, nlist, 48, 8, faiss.METRIC_INNER_PRODUCT)
+                index.nprobe = 32
+            elif len(ids) > FAISS_HNSW_THRESHOLD:
+                index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+            elif settings.embedding_quantization == "int8":
+                index = faiss.IndexScalarQuantizer(
+                    dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+                )
+            elif settings.embedding_quantization == "fp16":
+                index = faiss.IndexScalarQuantizer(
+                    dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+                )
+            else:
+                index = faiss.IndexFlatIP(dim)
+
+            if not index.is_trained:
+                index.train(vectors)
+            index.add(vectors)
+
+            self._faiss_index = index
+            self._faiss_ids = ids
+
+        return self._faiss_index, self._faiss_ids
+
+    def _search_faiss(self, query_embedding: List[float], n_results: int) -> Optional[List[SearchResult]]:
+        """Search the FAISS index; returns None if the index is unavailable"""
+        try:
+            index, ids = self._get_faiss_index()
+            if index is None:
+                return None
+
+            query = np.asarray([query_embedding], dtype=np.float32)
+            faiss.normalize_L2(query)
+            scores, indices = index.search(query, min(n_results, index.ntotal))
+
+            hit_ids = [ids[i] for i in indices[0] if i != -1]
+            records = self.collection.get(ids=hit_ids, include=["documents", "metadatas"])
+            by_id = {
+                chunk_id: (document, metadata)
+                for chunk_id, document, metadata in
+                zip(records["ids"], records["documents"], records["metadatas"])
+            }
+
+            search_results = []
+            for score, i in zip(scores[0], indices[0]):
+                if i == -1 or ids[i] not in by_id:
+                    continue
+                document, metadata = by_id[ids[i]]
+                # model_construct skips validation; fields come from our own store
+                search_results.append(SearchResult.model_construct(
+                    chunk_id=ids[i],
+                    document_id=metadata['document_id'],
+                    content=document,
+                    similarity_score=float(score),
+                    metadata=metadata
+                ))
+
+            return search_results
+
+        except Exception as e:
+            logger.exception("Error searching FAISS index")
+            return None
+
+    def _get_cached_matrix(self):
+        """Build (or reuse) the row-normalized embedding matrix"""
+        if self._cached_matrix is None:
+            results = self.collection.get(include=["embeddings"])
+            ids = results["ids"]
+            if not ids:
+                return None, []
+
+            matrix = np.asarray(results["embeddings"], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0.0] = 1.0
+            self._cached_matrix = matrix / norms
+            self._cached_matrix_ids = ids
+
+        return self._cached_matrix, self._cached_matrix_ids
+
+    def search_similar_bruteforce(self, query: str, n_results: int = 5) -> List[SearchResult]:
+        """Exact cosine search as a single BLAS matmul over the cached matrix.
+
+        For small collections this beats an HNSW graph walk outright; used as
+        the search path when FAISS is unavailable and the corpus is small.
+        """
+        try:
+            matrix, ids = self._get_cached_matrix()
+            if matrix is None:
+                return []
+
+            query_vector = np.asarray(
+                _embed_query(self.embedding_model, query.strip()), dtype=np.float32
+            )
+            query_vector /= (np.linalg.norm(query_vector) + 1e-12)
+
+            scores = matrix @ query_vector
+            k = min(n_results, scores.shape[0])
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            hit_ids = [ids[i] for i in top]
+            records = self.collection.get(ids=hit_ids, include=["documents", "metadatas"])
+            by_id = {
+                chunk_id: (document, metadata)
+                for chunk_id, document, metadata in
+                zip(records["ids"], records["documents"], records["metadatas"])
+            }
+
+            search_results = []
+            for i in top:
+                if ids[i] not in by_id:
+                    continue
+                document, metadata = by_id[ids[i]]
+                search_results.append(SearchResult.model_construct(
+                    chunk_id=ids[i],
+                    document_id=metadata['document_id'],
+                    content=document,
+                    similarity_score=float(scores[i]),
+                    metadata=metadata
+                ))
+
+            return search_results
+
+        except Exception:
+            logger.exception("Error in brute-force search")
+            return []
+
     def _generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using sentence transformers"""
-        embedding = self.embedding_model.encode(text)
+        key = self._text_hash(text)
+        cached = self._emb_cache_get([key])
+        if key in cached:
+            return cached[key].tolist()
+
+        embedding = self.embedding_model.encode(text, normalize_embeddings=True)
+        self._emb_cache_put([(key, embedding)])
         return embedding.tolist()
     
     def add_chunks(self, chunks: List[DocumentChunk]) -> bool:
         """Add document chunks to vector store"""
+        return self._write_chunks(chunks, upsert=False)
+
+    def upsert_chunks(self, chunks: List[DocumentChunk]) -> bool:
+        """Insert or update chunks in place.
+
+        collection.upsert overwrites existing ids in one index mutation,
+        skipping the delete-tombstone round-trip a delete + add pair costs.
+        """
+        return self._write_chunks(chunks, upsert=True)
+
+    def _write_chunks(self, chunks: List[DocumentChunk], upsert: bool) -> bool:
+        """Embed chunks as needed and write them with add or upsert"""
         try:
             ids = []
-            embeddings = []
             documents = []
             metadatas = []
-            
+
+            # Embed every chunk that needs it in one batched encode call:
+            # chunks without a vector, or with one from a different model
+            pending = [
+                chunk for chunk in chunks
+                if chunk.embedding is None or chunk.metadata.get("embedding_model") != settings.embedding_model
+            ]
+            if pending:
+                # Serve re-ingested content from the on-disk cache and only
+                # encode the chunks it has never seen
+                keys = [self._text_hash(chunk.content) for chunk in pending]
+                cached = self._emb_cache_get(keys)
+                missing = [i for i, key in enumerate(keys) if key not in cached]
+                if missing:
+                    vectors = self.embedding_model.encode(
+                        [pending[i].content for i in missing],
+                        batch_size=64,
+                        show_progress_bar=False,
+                        convert_to_numpy=True,
+                        normalize_embeddings=True
+                    )
+                    for i, vector in zip(missing, vectors):
+                        cached[keys[i]] = vector
+                    self._emb_cache_put([(keys[i], vector) for i, vector in zip(missing, vectors)])
+                for chunk, key in zip(pending, keys):
+                    chunk.embedding = cached[key].tolist()
+
             for chunk in chunks:
-                # Generate embedding if not provided
-                if chunk.embedding is None:
-                    chunk.embedding = self._generate_embedding(chunk.content)
-                
-                # Prepare metadata - convert lists and other types to strings
-                metadata = {
-                    "document_id": chunk.document_id,
-                    "chunk_index": chunk.chunk_index,
-                    "filename": chunk.metadata.get("filename", ""),
-                    "document_type": chunk.metadata.get("document_type", ""),
-                }
-                
-                # Add additional metadata, converting non-primitive types to strings
-                for key, value in chunk.metadata.items():
-                    if isinstance(value, (list, dict)):
-                        metadata[key] = str(value)
-                    elif isinstance(value, (str, int, float, bool)) or value is None:
-                        metadata[key] = value
-                    else:
-                        metadata[key] = str(value)
-                
+                # Coerce non-primitive values to JSON strings upfront, then
+                # overlay the identity keys - each field is written exactly
+                # once instead of duplicating filename/document_type
+                metadata = self._make_metadata(
+                    {
+                        key: value if isinstance(value, (str, int, float, bool)) or value is None
+                        else json.dumps(value, default=str)
+                        for key, value in chunk.metadata.items()
+                    },
+                    chunk.document_id,
+                    chunk.chunk_index,
+                    settings.embedding_model
+                )
+
                 ids.append(chunk.id)
-                embeddings.append(chunk.embedding)
                 documents.append(chunk.content)
                 metadatas.append(metadata)
-            
-            self.collection.add(
-                ids=ids,
-                embeddings=embeddings,
-                documents=documents,
-                metadatas=metadatas
-            )
+
+            # One contiguous float32 matrix for the whole batch, normalized in
+            # a single pass: freshly encoded vectors already are unit-norm,
+            # but caller-supplied or legacy-cached ones may not be. Chroma
+            # accepts the ndarray directly, skipping per-element boxing
+            embedding_matrix = self._normalize_rows([chunk.embedding for chunk in chunks])
+
+            writer = self.collection.upsert if upsert else self.collection.add
+            try:
+                writer(
+                    ids=ids,
+                    embeddings=embedding_matrix,
+                    documents=documents,
+                    metadatas=metadatas
+                )
+            except (TypeError, ValueError):
+                # Some Chroma versions only validate plain lists
+                writer(
+                    ids=ids,
+                    embeddings=embedding_matrix.tolist(),
+                    documents=documents,
+                    metadatas=metadatas
+                )
+            self._invalidate_faiss_index()
             return True
             
         except Exception as e:
-            print(f"Error adding chunks to vector store: {e}")
+            logger.exception("Error adding chunks to vector store")
             return False
     
+    async def aadd_chunks(self, chunks: List[DocumentChunk]) -> bool:
+        """Add chunks without blocking the event loop.
+
+        The encoder runs locally, so this is compute-bound rather than
+        network-bound - there is no async embedding API to await. Running
+        add_chunks in a worker thread keeps the event loop responsive while
+        the batch encodes.
+        """
+        return await asyncio.to_thread(self.add_chunks, chunks)
+
     def search_similar(self, query: str, n_results: int = 5) -> List[SearchResult]:
         """Search for similar document chunks"""
         try:
-            query_embedding = self._generate_embedding(query)
+            query_embedding = list(_embed_query(self.embedding_model, query.strip()))
+
+            # Prefer the FAISS index; without it, brute-force small
+            # collections; fall back to Chroma's query path
+            if faiss is not None:
+                faiss_results = self._search_faiss(query_embedding, n_results)
+                if faiss_results is not None:
+                    return faiss_results
+            elif self.collection.count() <= BRUTEFORCE_MAX_CHUNKS:
+                bruteforce_results = self.search_similar_bruteforce(query, n_results)
+                if bruteforce_results:
+                    return bruteforce_results
+
+            # Oversample candidates from the approximate index, then rerank
+            # them with exact cosine scores before returning the top k
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results * RERANK_OVERSAMPLE,
+                include=["documents", "metadatas", "distances", "embeddings"]
+            )
+
+            candidates = results.get('embeddings')
+            if candidates is not None and len(candidates[0]) > n_results:
+                matrix = np.asarray(candidates[0], dtype=np.float32)
+                query_vector = np.asarray(query_embedding, dtype=np.float32)
+                order, scores = _topk_cosine(matrix, query_vector, n_results)
+                return [
+                    SearchResult.model_construct(
+                        chunk_id=results['ids'][0][i],
+                        document_id=results['metadatas'][0][i]['document_id'],
+                        content=results['documents'][0][i],
+                        similarity_score=float(score),
+                        metadata=results['metadatas'][0][i]
+                    )
+                    for i, score in zip(order, scores)
+                ]
+
+            # One dereference per field per row instead of repeated
+            # dict-of-lists subscript chains
+            ids = results['ids'][0][:n_results]
+            documents = results['documents'][0][:n_results]
+            metadatas = results['metadatas'][0][:n_results]
+            distances = results['distances'][0][:n_results]
+
+            return [
+                SearchResult.model_construct(
+                    chunk_id=chunk_id,
+                    document_id=metadata['document_id'],
+                    content=document,
+                    similarity_score=1 - distance,  # Convert distance to similarity
+                    metadata=metadata
+                )
+                for chunk_id, document, metadata, distance in zip(ids, documents, metadatas, distances)
+            ]
             
+        except Exception as e:
+            logger.exception("Error searching vector store")
+            return []
+    
+    def search_similar_by_document_id(self, document_id: str, n_results: int = 3,
+                                      exclude_self: bool = True) -> List[SearchResult]:
+        """Search for chunks similar to a stored document, reusing its embeddings.
+
+        Uses the mean of the document's persisted chunk vectors as the query,
+        so no text has to be re-embedded. Excludes the document's own chunks
+        by default.
+        """
+        try:
+            stored = self.collection.get(
+                where={"document_id": document_id},
+                include=["embeddings"]
+            )
+            embeddings = stored.get("embeddings")
+            if embeddings is None or len(embeddings) == 0:
+                return []
+
+            query_embedding = np.asarray(embeddings, dtype=np.float32).mean(axis=0).tolist()
+
+            # Prefer the FAISS index; it has no metadata filter, so oversample
+            # by the document's own chunk count and drop self-hits afterwards
+            if faiss is not None:
+                extra = len(embeddings) if exclude_self else 0
+                faiss_results = self._search_faiss(query_embedding, n_results + extra)
+                if faiss_results is not None:
+                    if exclude_self:
+                        faiss_results = [
+                            result for result in faiss_results
+                            if result.document_id != document_id
+                        ]
+                    return faiss_results[:n_results]
+
+            where = {"document_id": {"$ne": document_id}} if exclude_self else None
+
             results = self.collection.query(
                 query_embeddings=[query_embedding],
                 n_results=n_results,
+                where=where,
                 include=["documents", "metadatas", "distances"]
             )
-            
+
             search_results = []
             for i in range(len(results['ids'][0])):
-                search_result = SearchResult(
+                search_result = SearchResult.model_construct(
                     chunk_id=results['ids'][0][i],
                     document_id=results['metadatas'][0][i]['document_id'],
                     content=results['documents'][0][i],
-                    similarity_score=1 - results['distances'][0][i],  # Convert distance to similarity
+                    similarity_score=1 - results['distances'][0][i],
                     metadata=results['metadatas'][0][i]
                 )
                 search_results.append(search_result)
-            
+
             return search_results
-            
+
         except Exception as e:
-            print(f"Error searching vector store: {e}")
+            logger.exception("Error searching by document id")
             return []
-    
+
     def get_document_chunks(self, document_id: str) -> List[SearchResult]:
         """Get all chunks for a specific document"""
         try:
@@ -114,30 +691,30 @@ class ChromaVectorStore:
                 include=["documents", "metadatas"]
             )
             
-            search_results = []
-            for i in range(len(results['ids'])):
-                search_result = SearchResult(
-                    chunk_id=results['ids'][i],
-                    document_id=results['metadatas'][i]['document_id'],
-                    content=results['documents'][i],
+            return [
+                SearchResult.model_construct(
+                    chunk_id=chunk_id,
+                    document_id=metadata['document_id'],
+                    content=document,
                     similarity_score=1.0,  # Exact match
-                    metadata=results['metadatas'][i]
+                    metadata=metadata
                 )
-                search_results.append(search_result)
-            
-            return search_results
+                for chunk_id, document, metadata in
+                zip(results['ids'], results['documents'], results['metadatas'])
+            ]
             
         except Exception as e:
-            print(f"Error getting document chunks: {e}")
+            logger.exception("Error getting document chunks")
             return []
     
     def delete_document(self, document_id: str) -> bool:
         """Delete all chunks for a specific document"""
         try:
             self.collection.delete(where={"document_id": document_id})
+            self._invalidate_faiss_index()
             return True
         except Exception as e:
-            print(f"Error deleting document: {e}")
+            logger.exception("Error deleting document")
             return False
     
     def get_collection_stats(self) -> Dict[str, Any]:
@@ -149,5 +726,5 @@ class ChromaVectorStore:
                 "collection_name": self.collection.name
             }
         except Exception as e:
-            print(f"Error getting collection stats: {e}")
+            logger.exception("Error getting collection stats")
             return {"error": str(e)} 
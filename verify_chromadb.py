@@ -6,6 +6,21 @@ Simple script to verify ChromaDB contents
 from vector_store import ChromaVectorStore
 import json
 
+def iter_all(collection, batch: int = 500):
+    """Stream (id, document, metadata) triples page by page instead of
+    materializing the whole collection in memory"""
+    offset = 0
+    while True:
+        results = collection.get(
+            limit=batch,
+            offset=offset,
+            include=["documents", "metadatas"]
+        )
+        if not results['ids']:
+            return
+        yield from zip(results['ids'], results['documents'], results['metadatas'])
+        offset += len(results['ids'])
+
 def main():
     print("🔍 ChromaDB Verification")
     print("=" * 30)
@@ -16,16 +31,15 @@ def main():
     stats = vector_store.get_collection_stats()
     print(f"📊 Collection Stats: {stats}")
     
-    # Get all documents
-    all_results = vector_store.collection.get()
-    
-    if not all_results['ids']:
+    total_chunks = vector_store.collection.count()
+
+    if not total_chunks:
         print("📭 No documents found in ChromaDB")
         return
-    
-    print(f"\n📄 Found {len(all_results['ids'])} chunks:")
-    
-    for i, (chunk_id, content, metadata) in enumerate(zip(all_results['ids'], all_results['documents'], all_results['metadatas']), 1):
+
+    print(f"\n📄 Found {total_chunks} chunks:")
+
+    for i, (chunk_id, content, metadata) in enumerate(iter_all(vector_store.collection), 1):
         print(f"\n{i}. Chunk ID: {chunk_id}")
         print(f"   Document: {metadata.get('filename', 'Unknown')}")
         print(f"   Document ID: {metadata.get('document_id', 'Unknown')}")